@@ -0,0 +1,131 @@
+"""
+Benchmark S3 calls made by the data request with and without the
+dataset manifest. The existing data is written to a local moto S3
+server, and all S3 access, including ooi-harvester's own lookup of
+``existing_data_path``, is pointed at it.
+
+Requires OOI credentials, since the request estimate is made against
+the OOI M2M API, and a stream config for a stream that is not
+discontinued.
+"""
+import os
+import sys
+import argparse
+from collections import Counter
+from pathlib import Path
+
+PORT = 5555
+# Must be set before fsspec is imported to apply to every S3 filesystem
+os.environ["FSSPEC_S3_ENDPOINT_URL"] = f"http://127.0.0.1:{PORT}"
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+import numpy as np  # noqa
+import pandas as pd  # noqa
+import s3fs  # noqa
+import xarray as xr  # noqa
+import yaml  # noqa
+from moto.server import ThreadedMotoServer  # noqa
+
+sys.path.append(str(Path(__file__).parent.parent.joinpath("recipe")))
+from ooi_harvester.producer import (  # noqa
+    StreamHarvest,
+    fetch_streams_list,
+    create_request_estimate,
+)
+from checkpoint import get_store_path  # noqa
+from manifest import update_manifest  # noqa
+from producer import get_request_range, CONFIG_PATH  # noqa
+
+S3_CALLS = Counter()
+_call_s3 = s3fs.S3FileSystem._call_s3
+
+
+async def _counted_call_s3(self, method, *args, **kwargs):
+    S3_CALLS[getattr(method, "__name__", method)] += 1
+    return await _call_s3(self, method, *args, **kwargs)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark dataset manifest')
+    parser.add_argument('--config', type=str, default=str(CONFIG_PATH))
+    parser.add_argument('--size', type=int, default=1_000_000)
+    parser.add_argument('--chunk-size', type=int, default=10_000)
+    parser.add_argument('--variables', type=int, default=10)
+    return parser.parse_args()
+
+
+def count_s3_calls(func, **kwargs):
+    S3_CALLS.clear()
+    s3fs.S3FileSystem.clear_instance_cache()
+    func(**kwargs)
+    return dict(S3_CALLS)
+
+
+def main(config, size, chunk_size, variables):
+    config_json = yaml.load(open(config), Loader=yaml.SafeLoader)
+    stream_harvest = StreamHarvest(**config_json)
+    harvest_options = stream_harvest.harvest_options
+    harvest_options.refresh = False
+    store_path = get_store_path(
+        harvest_options.path, stream_harvest.table_name
+    )
+    stream_dct = next(
+        s
+        for s in fetch_streams_list(stream_harvest)
+        if s['table_name'] == stream_harvest.table_name
+    )
+
+    server = ThreadedMotoServer(port=PORT)
+    server.start()
+    try:
+        fs = s3fs.S3FileSystem()
+        fs.mkdir(store_path.split("/")[2])
+        ds = xr.Dataset(
+            {
+                f"var_{i}": ("time", np.random.random(size))
+                for i in range(variables)
+            },
+            coords={
+                "time": pd.date_range("2020-01-01", periods=size, freq="s")
+            },
+        ).chunk({"time": chunk_size})
+        ds.to_zarr(fs.get_mapper(store_path), consolidated=True)
+        update_manifest(store_path, harvest_options.path_settings)
+
+        s3fs.S3FileSystem._call_s3 = _counted_call_s3
+        without_manifest = count_s3_calls(
+            create_request_estimate,
+            stream_dct=stream_dct,
+            start_dt=harvest_options.custom_range.start,
+            end_dt=harvest_options.custom_range.end,
+            refresh=False,
+            existing_data_path=harvest_options.path,
+            request_kwargs=dict(provenance=True),
+        )
+        with_manifest = count_s3_calls(
+            lambda: create_request_estimate(
+                stream_dct=stream_dct,
+                **get_request_range(stream_harvest),
+                request_kwargs=dict(provenance=True),
+            )
+        )
+    finally:
+        s3fs.S3FileSystem._call_s3 = _call_s3
+        server.stop()
+
+    total_without = sum(without_manifest.values())
+    total_with = sum(with_manifest.values())
+    print(f"Without manifest: {total_without} S3 calls {without_manifest}")
+    print(f"With manifest: {total_with} S3 calls {with_manifest}")
+    print(f"S3 calls avoided: {total_without - total_with}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(
+        config=args.config,
+        size=args.size,
+        chunk_size=args.chunk_size,
+        variables=args.variables,
+    )
@@ -0,0 +1,243 @@
+import json
+import datetime
+
+import dateutil.parser
+import fsspec
+import xarray as xr
+
+CHECKPOINT_NAME = ".harvest_checkpoint.json"
+HARVEST_RUN_NAME = ".harvest_run.json"
+# Response key set by the producer when it requests only the time range
+# still to be harvested. Holds the id of the request being resumed.
+RESUME_KEY = "resumes_request"
+
+
+def _parse_ts(ts):
+    return dateutil.parser.parse(ts).replace(tzinfo=None)
+
+
+def _to_naive_utc(dt):
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def get_store_path(data_bucket, table_name):
+    return f"{data_bucket.rstrip('/')}/{table_name}"
+
+
+def read_checkpoint(store_path, storage_options=None):
+    storage_options = storage_options or {}
+    fs, path = fsspec.core.url_to_fs(
+        f"{store_path}/{CHECKPOINT_NAME}", **storage_options
+    )
+    if not fs.exists(path):
+        return None
+    return json.loads(fs.cat(path))
+
+
+def write_checkpoint(checkpoint, store_path, storage_options=None):
+    storage_options = storage_options or {}
+    fs, path = fsspec.core.url_to_fs(
+        f"{store_path}/{CHECKPOINT_NAME}", **storage_options
+    )
+    checkpoint["last_updated"] = datetime.datetime.utcnow().isoformat()
+    fs.pipe(path, json.dumps(checkpoint).encode("utf-8"))
+
+
+def new_checkpoint(request_id, datasets):
+    return {
+        "request_id": request_id,
+        "created": datetime.datetime.utcnow().isoformat(),
+        "last_updated": None,
+        "datasets": sorted(
+            [
+                {
+                    "name": d["name"],
+                    "start_ts": _parse_ts(d["start_ts"]).isoformat(),
+                    "end_ts": _parse_ts(d["end_ts"]).isoformat(),
+                }
+                for d in datasets
+            ],
+            key=lambda d: d["start_ts"],
+        ),
+        "committed": [],
+        "committed_range": None,
+    }
+
+
+def get_store_time_range(store_path, storage_options=None):
+    """Get the first and last time in the zarr store, or None."""
+    storage_options = storage_options or {}
+    fs, path = fsspec.core.url_to_fs(store_path, **storage_options)
+    zarray_path = f"{path}/time/.zarray"
+    if not fs.exists(zarray_path):
+        return None
+    # Only the first and last time chunks are fetched here
+    with xr.open_zarr(fs.get_mapper(path)) as ds:
+        if ds.time.size == 0:
+            return None
+        start, end = ds.time[[0, -1]].values
+    modified = _to_naive_utc(fs.modified(zarray_path))
+    return {
+        "start": str(start),
+        "end": str(end),
+        "modified": modified.isoformat(),
+    }
+
+
+def sync_checkpoint(checkpoint, store_path, storage_options=None):
+    """
+    Mark source files as committed based on what the store
+    actually contains. Files previously marked as committed that
+    are no longer covered by the store are dropped again.
+    """
+    time_range = get_store_time_range(store_path, storage_options)
+    checkpoint["committed_range"] = time_range
+    if time_range is None or (
+        # Store has not been written since this checkpoint was created,
+        # so its contents belong to a previous harvest. S3 modification
+        # times have a resolution of one second.
+        _parse_ts(time_range["modified"])
+        < _parse_ts(checkpoint["created"]).replace(microsecond=0)
+    ):
+        checkpoint["committed"] = []
+        return checkpoint
+
+    store_start = _parse_ts(time_range["start"])
+    store_end = _parse_ts(time_range["end"])
+    committed = []
+    for d in checkpoint["datasets"]:
+        if (
+            _parse_ts(d["start_ts"]) >= store_start
+            and _parse_ts(d["end_ts"]) <= store_end
+        ):
+            committed.append(d["name"])
+        else:
+            # Resume at the first incomplete batch
+            break
+    checkpoint["committed"] = committed
+    return checkpoint
+
+
+def get_pending_datasets(checkpoint):
+    """Get the source files that have not been committed yet."""
+    if checkpoint is None:
+        return []
+    return [
+        d
+        for d in checkpoint["datasets"]
+        if d["name"] not in checkpoint["committed"]
+    ]
+
+
+def get_resume_point(checkpoint):
+    """
+    Get the time of the last committed record, after which the
+    harvest resumes, or None when there is nothing to resume.
+    """
+    if checkpoint is None or len(checkpoint["committed"]) == 0:
+        return None
+    if len(get_pending_datasets(checkpoint)) == 0:
+        return None
+    return _parse_ts(checkpoint["committed_range"]["end"])
+
+
+def is_resume_request(response):
+    """Whether the response is for a request resuming an earlier one."""
+    return RESUME_KEY in response
+
+
+def prepare_checkpoint(
+    response, store_path, storage_options=None, write=True
+):
+    """
+    Load the checkpoint for the current request, or for the request it
+    resumes, or start a new one when the request has changed since the
+    last run.
+    Returns None when the response holds no request result.
+    """
+    if "result" not in response:
+        return None
+    request_id = response["result"]["request_dt"]
+    checkpoint = read_checkpoint(store_path, storage_options)
+    if checkpoint is not None and checkpoint["request_id"] in [
+        request_id,
+        response.get(RESUME_KEY),
+    ]:
+        checkpoint = sync_checkpoint(checkpoint, store_path, storage_options)
+    else:
+        from ooi_harvester.utils.parser import (
+            parse_response_thredds,
+            filter_and_parse_datasets,
+        )
+
+        catalog_dict = filter_and_parse_datasets(
+            parse_response_thredds(response)
+        )
+        checkpoint = new_checkpoint(request_id, catalog_dict["datasets"])
+    if write:
+        write_checkpoint(checkpoint, store_path, storage_options)
+    return checkpoint
+
+
+def update_checkpoint(store_path, storage_options=None):
+    """Sync the stored checkpoint with the store, if there is one."""
+    checkpoint = read_checkpoint(store_path, storage_options)
+    if checkpoint is not None:
+        checkpoint = sync_checkpoint(checkpoint, store_path, storage_options)
+        write_checkpoint(checkpoint, store_path, storage_options)
+    return checkpoint
+
+
+def checkpoint_state_handler(store_path, storage_options=None):
+    """
+    Create a flow state handler that syncs the checkpoint once the
+    flow run has finished, including when it failed.
+    """
+
+    def _handler(flow, old_state, new_state):
+        if new_state.is_finished():
+            try:
+                update_checkpoint(store_path, storage_options)
+            except Exception as e:
+                print(f"Checkpoint update failed: {e}")
+        return new_state
+
+    return _handler
+
+
+def read_harvest_run(store_path, storage_options=None):
+    storage_options = storage_options or {}
+    fs, path = fsspec.core.url_to_fs(
+        f"{store_path}/{HARVEST_RUN_NAME}", **storage_options
+    )
+    if not fs.exists(path):
+        return None
+    return json.loads(fs.cat(path))
+
+
+def record_harvest_run(store_path, failed, storage_options=None):
+    """Record whether the last scheduled harvest run failed."""
+    storage_options = storage_options or {}
+    fs, path = fsspec.core.url_to_fs(
+        f"{store_path}/{HARVEST_RUN_NAME}", **storage_options
+    )
+    harvest_run = {
+        "failed": failed,
+        "store_range": get_store_time_range(store_path, storage_options),
+        "last_updated": datetime.datetime.utcnow().isoformat(),
+    }
+    fs.pipe(path, json.dumps(harvest_run).encode("utf-8"))
+    return harvest_run
+
+
+def should_resume_harvest(store_path, storage_options=None):
+    """
+    Whether the scheduled harvest should append to the store rather
+    than refresh it: the last run failed and the store holds data.
+    """
+    harvest_run = read_harvest_run(store_path, storage_options)
+    if harvest_run is None or not harvest_run["failed"]:
+        return False
+    return get_store_time_range(store_path, storage_options) is not None
@@ -3,12 +3,23 @@ import yaml
 import datetime
 import copy
 from pathlib import Path
-from prefect import Flow
+from prefect import Flow, task
 from prefect.schedules import CronSchedule
 from prefect.tasks.prefect import create_flow_run, wait_for_flow_run
+from prefect.triggers import any_failed
 from prefect.run_configs.ecs import ECSRun
 from prefect.storage.docker import Docker
 from ooi_harvester.settings.main import harvest_settings
+from ooi_harvester.producer.models import StreamHarvest
+
+from checkpoint import (
+    get_store_path,
+    should_resume_harvest,
+    record_harvest_run,
+)
+from manifest import update_manifest
+from flow_image import RECIPE_DIR, get_recipe_files
+from s3metrics import get_pool_env
 
 HERE = Path(__file__).resolve().parent
 BASE = HERE.parent
@@ -18,6 +29,7 @@ RUN_OPTIONS = {
         'PREFECT__CLOUD__HEARTBEAT_MODE': 'thread',
         'AWS_RETRY_MODE': 'adaptive',
         'AWS_MAX_ATTEMPTS': '100',
+        **get_pool_env(),
     },
     'task_role_arn': os.environ.get('TASK_ROLE_ARN', None),
     'cpu': '2 vcpu',
@@ -46,6 +58,61 @@ parent_run_opts = dict(**copy.deepcopy(RUN_OPTIONS))
 parent_run_opts.update({'cpu': '0.5 vcpu', 'memory': '2 GB'})
 parent_run_config = ECSRun(**parent_run_opts)
 
+
+def _get_store(config):
+    stream_harvest = StreamHarvest(**config)
+    harvest_options = stream_harvest.harvest_options
+    store_path = get_store_path(
+        harvest_options.path, stream_harvest.table_name
+    )
+    return store_path, harvest_options.path_settings, harvest_options.test
+
+
+@task
+def get_harvest_parameters(config):
+    """
+    Harvest parameters. After a failed run, append to the data it left
+    in the store instead of refreshing the stream.
+    """
+    config = copy.deepcopy(config)
+    try:
+        store_path, path_settings, _ = _get_store(config)
+        if should_resume_harvest(store_path, path_settings):
+            print("Last harvest failed, appending to existing data.")
+            config['harvest_options']['refresh'] = False
+    except Exception as e:
+        # Never hold up the harvest, it only won't resume
+        print(f"Resume check failed: {e}")
+    return {
+        'config': config,
+        'error_test': False,
+        'export_da': True,
+        'gh_write_da': True,
+    }
+
+
+@task
+def record_harvest_success(config):
+    store_path, path_settings, test = _get_store(config)
+    if not test:
+        record_harvest_run(store_path, False, path_settings)
+
+
+@task(trigger=any_failed)
+def record_harvest_failure(config):
+    store_path, path_settings, test = _get_store(config)
+    if not test:
+        record_harvest_run(store_path, True, path_settings)
+
+
+@task
+def update_store_manifest(config):
+    """Summarize the store after the harvest appended to it."""
+    store_path, path_settings, test = _get_store(config)
+    if not test:
+        update_manifest(store_path, path_settings)
+
+
 with Flow(
     flow_run_name, schedule=schedule, run_config=parent_run_config
 ) as parent_flow:
@@ -53,15 +120,16 @@ with Flow(
         flow_name="stream_harvest",
         run_name=flow_run_name,
         project_name=project_name,
-        parameters={
-            'config': config_json,
-            'error_test': False,
-            'export_da': True,
-            'gh_write_da': True,
-        },
+        parameters=get_harvest_parameters(config_json),
         run_config=run_config,
     )
     wait_for_flow = wait_for_flow_run(flow_run, raise_final_state=True)  # noqa
+    record_harvest_success(config_json, upstream_tasks=[wait_for_flow])
+    record_harvest_failure(config_json, upstream_tasks=[wait_for_flow])
+    update_store_manifest(config_json, upstream_tasks=[wait_for_flow])
+
+# The flow run state follows the harvest, not the bookkeeping tasks
+parent_flow.set_reference_tasks([wait_for_flow])
 
 now = datetime.datetime.utcnow()
 image_registry = "cormorack"
@@ -73,7 +141,8 @@ parent_flow.storage = Docker(
     dockerfile=HERE.joinpath("Dockerfile"),
     image_name=image_name,
     prefect_directory="/home/jovyan/prefect",
-    env_vars={'HARVEST_ENV': 'ooi-harvester'},
+    env_vars={'HARVEST_ENV': 'ooi-harvester', 'PYTHONPATH': RECIPE_DIR},
+    files=get_recipe_files(),
     python_dependencies=[
         'git+https://github.com/ooi-data/ooi-harvester.git@main'
     ],
@@ -0,0 +1,14 @@
+from pathlib import Path
+
+HERE = Path(__file__).parent.absolute()
+RECIPE_DIR = "/home/jovyan/recipe"
+# Recipe modules used by the flows at run time, shipped with the flow images
+RECIPE_MODULES = ["checkpoint.py", "manifest.py", "s3metrics.py"]
+
+
+def get_recipe_files():
+    """Docker storage ``files`` shipping the recipe modules."""
+    return {
+        str(HERE.joinpath(module)): f"{RECIPE_DIR}/{module}"
+        for module in RECIPE_MODULES
+    }
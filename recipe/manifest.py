@@ -0,0 +1,102 @@
+import json
+import math
+import datetime
+
+import fsspec
+
+from checkpoint import get_store_time_range
+
+MANIFEST_NAME = ".harvest_manifest.json"
+
+
+def _zmetadata_checksum(fs, path):
+    return str(fs.checksum(f"{path}/.zmetadata"))
+
+
+def read_manifest(store_path, storage_options=None):
+    storage_options = storage_options or {}
+    fs, path = fsspec.core.url_to_fs(
+        f"{store_path}/{MANIFEST_NAME}", **storage_options
+    )
+    try:
+        return json.loads(fs.cat(path))
+    except FileNotFoundError:
+        return None
+
+
+def get_current_manifest(store_path, storage_options=None):
+    """
+    Read the manifest, or None if it is missing or stale, i.e. the
+    store's consolidated metadata changed since it was written.
+    """
+    storage_options = storage_options or {}
+    manifest = read_manifest(store_path, storage_options)
+    if manifest is None:
+        return None
+    fs, path = fsspec.core.url_to_fs(store_path, **storage_options)
+    try:
+        checksum = _zmetadata_checksum(fs, path)
+    except FileNotFoundError:
+        return None
+    if checksum != manifest.get("zmetadata_checksum"):
+        return None
+    return manifest
+
+
+def write_manifest(manifest, store_path, storage_options=None):
+    storage_options = storage_options or {}
+    fs, path = fsspec.core.url_to_fs(
+        f"{store_path}/{MANIFEST_NAME}", **storage_options
+    )
+    fs.pipe(path, json.dumps(manifest).encode("utf-8"))
+
+
+def build_manifest(store_path, storage_options=None):
+    """
+    Summarize the zarr store from its consolidated metadata:
+    time range, variables and chunk counts.
+    """
+    storage_options = storage_options or {}
+    fs, path = fsspec.core.url_to_fs(store_path, **storage_options)
+    zmetadata = json.loads(fs.cat(f"{path}/.zmetadata"))["metadata"]
+    variables = {}
+    for key, meta in zmetadata.items():
+        if not key.endswith("/.zarray"):
+            continue
+        name = key[: -len("/.zarray")]
+        attrs = zmetadata.get(f"{name}/.zattrs", {})
+        variables[name] = {
+            "dims": attrs.get("_ARRAY_DIMENSIONS", []),
+            "shape": meta["shape"],
+            "chunks": meta["chunks"],
+            "chunk_count": math.prod(
+                math.ceil(s / c) for s, c in zip(meta["shape"], meta["chunks"])
+            ),
+        }
+    return {
+        "last_updated": datetime.datetime.utcnow().isoformat(),
+        "zmetadata_checksum": _zmetadata_checksum(fs, path),
+        "time_range": get_store_time_range(store_path, storage_options),
+        "variables": variables,
+        "chunk_count": sum(v["chunk_count"] for v in variables.values()),
+    }
+
+
+def update_manifest(store_path, storage_options=None):
+    manifest = build_manifest(store_path, storage_options)
+    write_manifest(manifest, store_path, storage_options)
+    return manifest
+
+
+def manifest_state_handler(store_path, storage_options=None):
+    """Create a flow state handler that writes the manifest on success."""
+
+    def _handler(flow, old_state, new_state):
+        if new_state.is_successful():
+            try:
+                update_manifest(store_path, storage_options)
+            except Exception as e:
+                print(f"Manifest update failed: {e}")
+        return new_state
+
+    return _handler
@@ -20,6 +20,16 @@ from ooi_harvester.utils.github import (
     write_process_status_json,
 )
 
+from checkpoint import (
+    get_store_path,
+    prepare_checkpoint,
+    is_resume_request,
+    checkpoint_state_handler,
+)
+from manifest import manifest_state_handler
+from flow_image import RECIPE_DIR, get_recipe_files
+from s3metrics import get_pool_env, s3_metrics_state_handler
+
 HERE = Path(__file__).parent.absolute()
 BASE = HERE.parent.absolute()
 CONFIG_PATH = BASE.joinpath(CONFIG_PATH_STR)
@@ -77,6 +87,23 @@ def main(test_run, refresh, data_bucket, project_name, run_flow):
 
     # Get name and image tag
     name = response['stream']['table_name']
+
+    store_path = get_store_path(data_bucket, name)
+    path_settings = stream_harvest.harvest_options.path_settings
+    test = stream_harvest.harvest_options.test
+    # The producer requested only the data still to be harvested
+    # by an earlier, incomplete run, so it must be appended
+    if is_resume_request(response):
+        print("Resuming incomplete harvest, appending to existing data.")
+        stream_harvest.harvest_options.refresh = False
+    try:
+        prepare_checkpoint(
+            response, store_path, path_settings, write=not test
+        )
+    except Exception as e:
+        # The harvest still runs, it only won't be resumable
+        print(f"Checkpoint preparation failed: {e}")
+
     now = datetime.datetime.utcnow()
     image_registry = IMAGE_REGISTRY
     image_name = IMAGE_NAME
@@ -87,7 +114,8 @@ def main(test_run, refresh, data_bucket, project_name, run_flow):
         dockerfile=HERE.joinpath("Dockerfile"),
         image_name=image_name,
         prefect_directory="/home/jovyan/prefect",
-        env_vars={'HARVEST_ENV': 'ooi-harvester'},
+        env_vars={'HARVEST_ENV': 'ooi-harvester', 'PYTHONPATH': RECIPE_DIR},
+        files=get_recipe_files(),
         python_dependencies=[
             'git+https://github.com/ooi-data/ooi-harvester.git@main'
         ],
@@ -101,6 +129,7 @@ def main(test_run, refresh, data_bucket, project_name, run_flow):
             'OOI_USERNAME': os.environ.get('OOI_USERNAME', None),
             'OOI_TOKEN': os.environ.get('OOI_TOKEN', None),
             'PREFECT__CLOUD__HEARTBEAT_MODE': 'thread',
+            **get_pool_env(),
         },
         'cpu': '2 vcpu',
         'memory': '16 GB',
@@ -125,6 +154,14 @@ def main(test_run, refresh, data_bucket, project_name, run_flow):
         data_availability=True,
         da_config={'gh_write': True},
     )
+    if not test:
+        pipeline.flow.state_handlers.extend(
+            [
+                s3_metrics_state_handler(store_path, path_settings),
+                checkpoint_state_handler(store_path, path_settings),
+                manifest_state_handler(store_path, path_settings),
+            ]
+        )
     pipeline.flow.validate()
     print(pipeline)
 
@@ -27,11 +27,21 @@ from ooi_harvester.config import (
 )
 from ooi_harvester.utils.github import get_status_json, commit, push, create_request_commit_message
 
+from checkpoint import (
+    get_store_path,
+    get_resume_point,
+    update_checkpoint,
+    RESUME_KEY,
+)
+from manifest import get_current_manifest
+
 HERE = Path(__file__).parent.absolute()
 BASE = HERE.parent.absolute()
 CONFIG_PATH = BASE.joinpath(CONFIG_PATH_STR)
 RESPONSE_PATH = BASE.joinpath(RESPONSE_PATH_STR)
 REQUEST_STATUS_PATH = BASE.joinpath(REQUEST_STATUS_PATH_STR)
+# OOI requests have millisecond resolution
+REQUEST_RESOLUTION = datetime.timedelta(milliseconds=1)
 
 
 def parse_args():
@@ -45,6 +55,75 @@ def parse_args():
     return parser.parse_args()
 
 
+def get_request_range(stream_harvest: StreamHarvest) -> dict:
+    harvest_options = stream_harvest.harvest_options
+    request_range = dict(
+        start_dt=harvest_options.custom_range.start,
+        end_dt=harvest_options.custom_range.end,
+        refresh=harvest_options.refresh,
+        existing_data_path=harvest_options.path,
+    )
+    if harvest_options.refresh:
+        return request_range
+
+    manifest = get_current_manifest(
+        get_store_path(harvest_options.path, stream_harvest.table_name),
+        harvest_options.path_settings,
+    )
+    if manifest is None or manifest['time_range'] is None:
+        print("No current dataset manifest, inspecting existing data ...")
+        return request_range
+
+    # Request from just after the existing data, as given by the manifest,
+    # instead of from the start of the requested range.
+    start_dt = (
+        dateutil.parser.parse(manifest['time_range']['end'])
+        + REQUEST_RESOLUTION
+    )
+    custom_start = request_range['start_dt']
+    if isinstance(custom_start, str):
+        custom_start = dateutil.parser.parse(custom_start)
+    if custom_start is not None:
+        start_dt = max(start_dt, custom_start.replace(tzinfo=None))
+    print(f"Using dataset manifest, requesting data from {start_dt} ...")
+    request_range.update(start_dt=start_dt.isoformat())
+    return request_range
+
+
+def get_resume_checkpoint(stream_harvest: StreamHarvest):
+    """Get the checkpoint of an incomplete harvest to resume, or None."""
+    harvest_options = stream_harvest.harvest_options
+    store_path = get_store_path(
+        harvest_options.path, stream_harvest.table_name
+    )
+    try:
+        checkpoint = update_checkpoint(
+            store_path, harvest_options.path_settings
+        )
+    except Exception as e:
+        print(f"Checkpoint check failed, requesting without resume: {e}")
+        return None
+    if get_resume_point(checkpoint) is None:
+        return None
+    return checkpoint
+
+
+def get_resume_range(stream_harvest: StreamHarvest, checkpoint) -> dict:
+    """
+    Request only the data after the last committed record, so the
+    response lists only the source files still to be harvested.
+    """
+    harvest_options = stream_harvest.harvest_options
+    start_dt = get_resume_point(checkpoint) + REQUEST_RESOLUTION
+    print(f"Resuming incomplete harvest, requesting data from {start_dt} ...")
+    return dict(
+        start_dt=start_dt.isoformat(),
+        end_dt=harvest_options.custom_range.end,
+        refresh=False,
+        existing_data_path=harvest_options.path,
+    )
+
+
 def produce(data_check: bool, stream_harvest: StreamHarvest) -> dict:
     table_name = stream_harvest.table_name
     if data_check:
@@ -121,15 +200,19 @@ def produce(data_check: bool, stream_harvest: StreamHarvest) -> dict:
             stream_exists = False
 
         if stream_exists:
+            resume_checkpoint = get_resume_checkpoint(stream_harvest)
+            if resume_checkpoint is not None:
+                request_range = get_resume_range(
+                    stream_harvest, resume_checkpoint
+                )
+            else:
+                request_range = get_request_range(stream_harvest)
             if stream_harvest.harvest_options.goldcopy:
                 try:
                     print("Fetching from OOI Gold Copy ...")
                     request_response = create_catalog_request(
                         stream_dct=stream_dct,
-                        start_dt=stream_harvest.harvest_options.custom_range.start,
-                        end_dt=stream_harvest.harvest_options.custom_range.end,
-                        refresh=stream_harvest.harvest_options.refresh,
-                        existing_data_path=stream_harvest.harvest_options.path,
+                        **request_range,
                         client_kwargs=stream_harvest.harvest_options.path_settings,
                     )
                     status_json = get_status_json(
@@ -143,17 +226,14 @@ def produce(data_check: bool, stream_harvest: StreamHarvest) -> dict:
             else:
                 estimated_request = create_request_estimate(
                     stream_dct=stream_dct,
-                    start_dt=stream_harvest.harvest_options.custom_range.start,
-                    end_dt=stream_harvest.harvest_options.custom_range.end,
-                    refresh=stream_harvest.harvest_options.refresh,
-                    existing_data_path=stream_harvest.harvest_options.path,
+                    **request_range,
                     request_kwargs=dict(provenance=True)
                 )
                 if "requestUUID" in estimated_request['estimated']:
                     print("Continue to actual request ...")
                     request_response = perform_request(
                         estimated_request,
-                        refresh=stream_harvest.harvest_options.refresh,
+                        refresh=request_range['refresh'],
                     )
 
                     status_json = get_status_json(
@@ -165,6 +245,9 @@ def produce(data_check: bool, stream_harvest: StreamHarvest) -> dict:
                     status_json = get_status_json(
                         table_name, request_dt, 'failed'
                     )
+            if resume_checkpoint is not None and 'result' in request_response:
+                # Tells the pipeline to append, and to keep the checkpoint
+                request_response[RESUME_KEY] = resume_checkpoint['request_id']
 
         print("Data Request completed.")
         RESPONSE_PATH.write_text(json.dumps(request_response))
@@ -0,0 +1,132 @@
+import json
+import time
+import datetime
+from collections import Counter
+
+import fsspec
+import s3fs
+
+METRICS_NAME = ".harvest_s3_metrics.json"
+# Connections per S3 filesystem, botocore defaults to 10
+MAX_POOL_CONNECTIONS = 20
+PUT_METHODS = ["put_object", "upload_part"]
+THROTTLE_CODES = ["SlowDown", "Throttling", "ThrottlingException", "503"]
+
+
+def get_pool_env(max_pool_connections=MAX_POOL_CONNECTIONS):
+    """
+    Environment variables that bound the connection pool of every
+    S3 filesystem opened in a flow run, through fsspec's config.
+    """
+    return {
+        "FSSPEC_S3": json.dumps(
+            {"config_kwargs": {"max_pool_connections": max_pool_connections}}
+        )
+    }
+
+
+def _error_code(error):
+    response = getattr(error, "response", None) or {}
+    return str(response.get("Error", {}).get("Code", ""))
+
+
+class S3Metrics:
+    """
+    Count the S3 requests made through s3fs in this process:
+    calls per method, botocore retries, throttled calls and
+    bytes uploaded.
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.retries = 0
+        self.throttled = 0
+        self.bytes_put = 0
+        self.started = None
+        self.seconds = 0.0
+        self._call_s3 = None
+
+    def install(self):
+        if self._call_s3 is not None:
+            return
+        self._call_s3 = call_s3 = s3fs.S3FileSystem._call_s3
+        self.started = time.time()
+        metrics = self
+
+        async def _counted_call_s3(fs, method, *akwarglist, **kwargs):
+            name = getattr(method, "__name__", method)
+            metrics.calls[name] += 1
+            try:
+                out = await call_s3(fs, method, *akwarglist, **kwargs)
+            except Exception as e:
+                if _error_code(e) in THROTTLE_CODES:
+                    metrics.throttled += 1
+                raise
+            if isinstance(out, dict):
+                metrics.retries += out.get("ResponseMetadata", {}).get(
+                    "RetryAttempts", 0
+                )
+            if name in PUT_METHODS:
+                metrics.bytes_put += len(kwargs.get("Body", b""))
+            return out
+
+        s3fs.S3FileSystem._call_s3 = _counted_call_s3
+
+    def uninstall(self):
+        if self._call_s3 is None:
+            return
+        s3fs.S3FileSystem._call_s3 = self._call_s3
+        self._call_s3 = None
+        self.seconds = time.time() - self.started
+
+    def summary(self):
+        puts = sum(self.calls[m] for m in PUT_METHODS)
+        return {
+            "calls": dict(self.calls),
+            "puts": puts,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "bytes_put": self.bytes_put,
+            "seconds": round(self.seconds, 2),
+            "put_mb_per_second": (
+                round(self.bytes_put / 1e6 / self.seconds, 3)
+                if self.seconds > 0
+                else None
+            ),
+        }
+
+
+def write_metrics(summary, store_path, storage_options=None):
+    storage_options = storage_options or {}
+    fs, path = fsspec.core.url_to_fs(
+        f"{store_path}/{METRICS_NAME}", **storage_options
+    )
+    fs.pipe(path, json.dumps(summary).encode("utf-8"))
+
+
+def s3_metrics_state_handler(store_path, storage_options=None):
+    """
+    Create a flow state handler that counts S3 requests while the
+    flow runs, and records them next to the store when it finishes.
+    Only requests made in the flow runner process are counted.
+    """
+    metrics = S3Metrics()
+
+    def _handler(flow, old_state, new_state):
+        if new_state.is_running():
+            metrics.install()
+        elif new_state.is_finished():
+            metrics.uninstall()
+            summary = dict(
+                metrics.summary(),
+                state=type(new_state).__name__,
+                finished=datetime.datetime.utcnow().isoformat(),
+            )
+            print(f"S3 requests: {summary}")
+            try:
+                write_metrics(summary, store_path, storage_options)
+            except Exception as e:
+                print(f"S3 metrics write failed: {e}")
+        return new_state
+
+    return _handler
@@ -0,0 +1,466 @@
+from pathlib import Path
+import json
+import time
+import datetime
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import fsspec
+import numpy as np
+import xarray as xr
+import yaml
+
+from ooi_harvester.producer.models import StreamHarvest
+from ooi_harvester.utils.parser import (
+    parse_response_thredds,
+    filter_and_parse_datasets,
+)
+from ooi_harvester.config import (
+    CONFIG_PATH_STR,
+    RESPONSE_PATH_STR,
+    PROCESS_STATUS_PATH_STR,
+)
+from ooi_harvester.utils.github import write_process_status_json
+
+from checkpoint import get_store_path
+
+HERE = Path(__file__).parent.absolute()
+BASE = HERE.parent.absolute()
+CONFIG_PATH = BASE.joinpath(CONFIG_PATH_STR)
+RESPONSE_PATH = BASE.joinpath(RESPONSE_PATH_STR)
+PROCESS_STATUS_PATH = BASE.joinpath(PROCESS_STATUS_PATH_STR)
+
+CHUNK_SIZE = 1_000_000
+# Per source file statistics, kept with the store so each source file
+# is read once, and still verifiable after OOI purges the request
+SOURCE_CACHE_NAME = ".harvest_verify_sources.json"
+GAP_FACTOR = 10
+# Process status written once the harvest flow run has finished
+HARVEST_DONE_STATUS = "success"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Verify harvested zarr against source files'
+    )
+    parser.add_argument(
+        '--path',
+        type=str,
+        default="s3://ooi-data",
+        help='Bucket url where data is stored. Default is s3://ooi-data',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=8,
+        help="Number of processes reading source files in parallel.",
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help=(
+            "Verify regardless of the harvest status "
+            "and print the results without writing the process status."
+        ),
+    )
+
+    return parser.parse_args()
+
+
+def _new_stats():
+    return {
+        'count': 0,
+        'time_checksum': 0,
+        'time_min': None,
+        'time_max': None,
+        'non_monotonic': 0,
+        'duplicates': 0,
+        'gaps': 0,
+        'max_gap_seconds': 0.0,
+        'outside_range': 0,
+        'variables': {},
+    }
+
+
+def _add_checksum(a, b):
+    return (int(a) + int(b)) % 2**64
+
+
+def _update_time_stats(stats, times, last_time):
+    stats['count'] += times.size
+    # Order independent checksum, wraps around on overflow
+    stats['time_checksum'] = _add_checksum(
+        stats['time_checksum'], np.sum(times.view('uint64'), dtype='uint64')
+    )
+    if last_time is not None:
+        times = np.concatenate([[last_time], times])
+    diffs = np.diff(times)
+    stats['non_monotonic'] += int(np.count_nonzero(diffs < 0))
+    stats['duplicates'] += int(np.count_nonzero(diffs == 0))
+    positive = diffs[diffs > 0]
+    if positive.size > 0:
+        gaps = positive[positive > GAP_FACTOR * np.median(positive)]
+        stats['gaps'] += int(gaps.size)
+        if gaps.size > 0:
+            stats['max_gap_seconds'] = max(
+                stats['max_gap_seconds'], float(gaps.max()) / 1e9
+            )
+    chunk_min, chunk_max = int(times.min()), int(times.max())
+    if stats['time_min'] is None or chunk_min < stats['time_min']:
+        stats['time_min'] = chunk_min
+    if stats['time_max'] is None or chunk_max > stats['time_max']:
+        stats['time_max'] = chunk_max
+
+
+def _combine(a, b, func):
+    """Combine two reductions that are None when empty."""
+    values = [v for v in [a, b] if v is not None]
+    return func(values) if values else None
+
+
+def _update_variable_stats(stats, values):
+    values = values.astype('float64')
+    valid = values[np.isfinite(values)]
+    stats['nan_count'] += int(values.size - valid.size)
+    if valid.size == 0:
+        return
+    stats['sum'] += float(np.sum(valid))
+    stats['min'] = _combine(stats['min'], float(valid.min()), min)
+    stats['max'] = _combine(stats['max'], float(valid.max()), max)
+
+
+def _merge_ranges(time_ranges):
+    merged = []
+    for start, end in sorted(time_ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return np.array(merged, dtype='int64').reshape(-1, 2)
+
+
+def _in_ranges(times, ranges):
+    idx = np.searchsorted(ranges[:, 0], times, side='right') - 1
+    return (idx >= 0) & (times <= ranges[np.maximum(idx, 0), 1])
+
+
+def compute_stats(ds, chunk_size=CHUNK_SIZE, time_ranges=None):
+    """
+    Compute record, time and per-variable statistics of a dataset
+    by reducing one chunk along the time dimension at a time.
+    When ``time_ranges`` are given, only records within them are reduced.
+    """
+    stats = _new_stats()
+    dim = ds['time'].dims[0]
+    variables = [
+        name
+        for name, var in ds.data_vars.items()
+        if var.dims[:1] == (dim,) and var.dtype.kind in 'biuf'
+    ]
+    for name in variables:
+        stats['variables'][name] = {
+            'nan_count': 0,
+            'sum': 0.0,
+            'min': None,
+            'max': None,
+        }
+    if time_ranges is not None:
+        time_ranges = _merge_ranges(time_ranges)
+
+    last_time = None
+    for start in range(0, ds.sizes[dim], chunk_size):
+        chunk = ds.isel({dim: slice(start, start + chunk_size)})
+        times = chunk['time'].values.astype('datetime64[ns]').view('int64')
+        mask = slice(None)
+        if time_ranges is not None:
+            mask = _in_ranges(times, time_ranges)
+            stats['outside_range'] += int(np.count_nonzero(~mask))
+            times = times[mask]
+        if times.size == 0:
+            continue
+        _update_time_stats(stats, times, last_time)
+        last_time = times[-1]
+        for name in variables:
+            _update_variable_stats(
+                stats['variables'][name], chunk[name].values[mask]
+            )
+    return stats
+
+
+def source_stats(url, chunk_size=CHUNK_SIZE):
+    with fsspec.open(url, mode='rb') as f:
+        with xr.open_dataset(f, engine='h5netcdf') as ds:
+            return compute_stats(ds, chunk_size)
+
+
+def _safe_source_stats(url):
+    """Returns the url, its stats or error, and whether it has expired."""
+    try:
+        return url, source_stats(url), None, False
+    except FileNotFoundError as e:
+        # OOI purges the results of a request after a while
+        return url, None, str(e), True
+    except Exception as e:
+        return url, None, str(e), False
+
+
+def read_source_cache(store_path, storage_options=None):
+    storage_options = storage_options or {}
+    fs, path = fsspec.core.url_to_fs(
+        f"{store_path}/{SOURCE_CACHE_NAME}", **storage_options
+    )
+    try:
+        return json.loads(fs.cat(path))
+    except FileNotFoundError:
+        return {}
+
+
+def write_source_cache(cache, store_path, storage_options=None):
+    storage_options = storage_options or {}
+    fs, path = fsspec.core.url_to_fs(
+        f"{store_path}/{SOURCE_CACHE_NAME}", **storage_options
+    )
+    fs.pipe(path, json.dumps(cache).encode("utf-8"))
+
+
+def store_stats(store_path, storage_options=None, time_ranges=None):
+    storage_options = storage_options or {}
+    fs, path = fsspec.core.url_to_fs(store_path, **storage_options)
+    with xr.open_zarr(fs.get_mapper(path)) as ds:
+        # Reduce along the store's own chunks
+        chunk_size = ds['time'].encoding.get('chunks', (CHUNK_SIZE,))[0]
+        return compute_stats(ds, chunk_size, time_ranges=time_ranges)
+
+
+def merge_stats(stats_list):
+    merged = _new_stats()
+    for stats in stats_list:
+        merged['count'] += stats['count']
+        merged['time_checksum'] = _add_checksum(
+            merged['time_checksum'], stats['time_checksum']
+        )
+        for key in ['non_monotonic', 'duplicates', 'gaps']:
+            merged[key] += stats[key]
+        merged['max_gap_seconds'] = max(
+            merged['max_gap_seconds'], stats['max_gap_seconds']
+        )
+        for key, func in [('time_min', min), ('time_max', max)]:
+            merged[key] = _combine(merged[key], stats[key], func)
+        for name, var_stats in stats['variables'].items():
+            if name not in merged['variables']:
+                merged['variables'][name] = dict(var_stats)
+                continue
+            merged_var = merged['variables'][name]
+            merged_var['nan_count'] += var_stats['nan_count']
+            merged_var['sum'] += var_stats['sum']
+            merged_var['min'] = _combine(
+                merged_var['min'], var_stats['min'], min
+            )
+            merged_var['max'] = _combine(
+                merged_var['max'], var_stats['max'], max
+            )
+    return merged
+
+
+def _check(source, store, rtol=None):
+    # Reductions over no valid values are None
+    if rtol is None or source is None or store is None:
+        passed = source == store
+    else:
+        passed = bool(np.isclose(source, store, rtol=rtol, equal_nan=True))
+    return {'source': source, 'store': store, 'passed': passed}
+
+
+def _to_iso(ns):
+    if ns is None:
+        return None
+    return str(np.datetime64(ns, 'ns'))
+
+
+def compare_stats(source, store, rtol=1e-6):
+    checks = {
+        'record_count': _check(source['count'], store['count']),
+        'time_checksum': _check(
+            str(source['time_checksum']), str(store['time_checksum'])
+        ),
+        'time_range': _check(
+            [_to_iso(source['time_min']), _to_iso(source['time_max'])],
+            [_to_iso(store['time_min']), _to_iso(store['time_max'])],
+        ),
+        'time_monotonic': {
+            'non_monotonic': store['non_monotonic'],
+            'passed': store['non_monotonic'] == 0,
+        },
+        'time_duplicates': {
+            'source': source['duplicates'],
+            'store': store['duplicates'],
+            'passed': store['duplicates'] == 0,
+        },
+        # Gaps are reported but do not fail the verification
+        'time_gaps': {
+            'gaps': store['gaps'],
+            'max_gap_seconds': store['max_gap_seconds'],
+        },
+        'variables': {},
+    }
+    for name, source_var in source['variables'].items():
+        store_var = store['variables'].get(name)
+        if store_var is None:
+            checks['variables'][name] = {'passed': False}
+            continue
+        var_checks = {
+            key: _check(source_var[key], store_var[key], rtol=rtol)
+            for key in ['sum', 'min', 'max']
+        }
+        var_checks['nan_count'] = _check(
+            source_var['nan_count'], store_var['nan_count']
+        )
+        checks['variables'][name] = {
+            'passed': all(c['passed'] for c in var_checks.values()),
+            **var_checks,
+        }
+    return checks
+
+
+def _all_passed(checks):
+    if 'passed' in checks:
+        return checks['passed']
+    return all(
+        _all_passed(c) for c in checks.values() if isinstance(c, dict)
+    )
+
+
+def get_source_urls(response):
+    catalog_dict = filter_and_parse_datasets(
+        parse_response_thredds(response)
+    )
+    return [
+        f"{catalog_dict['base_tds_url']}/thredds/fileServer/{d['urlPath']}"
+        for d in catalog_dict['datasets']
+    ]
+
+
+def verify(response, store_path, storage_options=None, workers=8):
+    """
+    Verify the store against the source files of the request.
+    Source files are read once, their statistics are cached with the
+    store. Files OOI has purged before they were read are skipped,
+    and the store is only compared within the time ranges of the
+    files that were read. Data appended to the store after the
+    request, by the daily harvest, lies outside them and is skipped.
+    """
+    start_time = time.time()
+    cache = read_source_cache(store_path, storage_options)
+    try:
+        urls = get_source_urls(response)
+    except Exception as e:
+        print(f"Source catalog unavailable, using cached files only: {e}")
+        urls = list(cache)
+
+    pending = [url for url in urls if url not in cache]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_safe_source_stats, pending))
+    missing_files = []
+    expired_files = 0
+    for url, stats, error, expired in results:
+        if stats is not None:
+            cache[url] = stats
+        elif expired:
+            expired_files += 1
+        else:
+            missing_files.append({'url': url, 'error': error})
+    if any(stats is not None for _, stats, _, _ in results):
+        write_source_cache(cache, store_path, storage_options)
+
+    verified = [cache[url] for url in urls if url in cache]
+    source = merge_stats(verified)
+
+    checks = {}
+    records_outside_sources = None
+    if source['count'] > 0:
+        store = store_stats(
+            store_path,
+            storage_options,
+            time_ranges=[
+                (s['time_min'], s['time_max'])
+                for s in verified
+                if s['count'] > 0
+            ],
+        )
+        checks = compare_stats(source, store)
+        records_outside_sources = store['outside_range']
+        passed = not missing_files and _all_passed(checks)
+        status = 'passed' if passed else 'failed'
+    else:
+        # Nothing left to verify against
+        status = 'failed' if missing_files else 'skipped'
+    return {
+        'last_verified': datetime.datetime.utcnow().isoformat(),
+        'status': status,
+        'duration_seconds': round(time.time() - start_time, 2),
+        'source_files': len(urls),
+        'verified_files': len(verified),
+        'expired_files': expired_files,
+        'missing_files': missing_files,
+        'store_records_outside_sources': records_outside_sources,
+        'checks': checks,
+    }
+
+
+def main(data_bucket, workers, dry_run):
+    status_json = None
+    if PROCESS_STATUS_PATH.exists():
+        status_json = yaml.load(
+            PROCESS_STATUS_PATH.open(), Loader=yaml.SafeLoader
+        )
+    if not dry_run:
+        if status_json is None:
+            print("No process status found. Skipping verification.")
+            return
+        if status_json.get('status') != HARVEST_DONE_STATUS:
+            print(
+                f"Harvest status is {status_json.get('status')}. "
+                "Skipping verification."
+            )
+            return
+        verification = status_json.get('verification') or {}
+        if verification.get('harvest_updated') == status_json.get(
+            'last_updated'
+        ):
+            print("Harvest already verified. Skipping verification.")
+            return
+
+    response = json.load(RESPONSE_PATH.open())
+    config_json = yaml.load(CONFIG_PATH.open(), Loader=yaml.SafeLoader)
+    stream_harvest = StreamHarvest(**config_json)
+    name = response['stream']['table_name']
+
+    print("1) VERIFYING DATA STREAM")
+    verification = verify(
+        response,
+        get_store_path(data_bucket, name),
+        storage_options=stream_harvest.harvest_options.path_settings,
+        workers=workers,
+    )
+    print(
+        f"Verification {verification['status']} "
+        f"in {verification['duration_seconds']}s"
+    )
+
+    if dry_run:
+        print(yaml.dump(verification))
+    else:
+        print("2) WRITING VERIFICATION STATUS")
+        # Ties the result to the harvest run it verified
+        verification['harvest_updated'] = status_json.get('last_updated')
+        status_json['verification'] = verification
+        write_process_status_json(status_json)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(
+        data_bucket=args.path,
+        workers=args.workers,
+        dry_run=args.dry_run,
+    )
@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import s3fs
+from moto.server import ThreadedMotoServer
+
+sys.path.append(str(Path(__file__).parent.parent.joinpath("recipe")))
+
+PORT = 5555
+BUCKET = "ooi-data"
+
+
+@pytest.fixture(scope="session")
+def s3_server():
+    server = ThreadedMotoServer(port=PORT)
+    server.start()
+    yield f"http://127.0.0.1:{PORT}"
+    server.stop()
+
+
+@pytest.fixture
+def storage_options(s3_server):
+    options = dict(
+        key="testing",
+        secret="testing",
+        client_kwargs={"endpoint_url": s3_server},
+    )
+    fs = s3fs.S3FileSystem(skip_instance_cache=True, **options)
+    fs.mkdir(BUCKET)
+    yield dict(options, skip_instance_cache=True)
+    fs.rm(BUCKET, recursive=True)
+
+
+@pytest.fixture
+def stream_harvest(storage_options):
+    return SimpleNamespace(
+        table_name="test-stream",
+        harvest_options=SimpleNamespace(
+            path="s3://ooi-data",
+            path_settings=storage_options,
+            refresh=False,
+            goldcopy=False,
+            custom_range=SimpleNamespace(start=None, end=None),
+        ),
+    )
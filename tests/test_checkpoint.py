@@ -0,0 +1,124 @@
+import fsspec
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from checkpoint import (
+    RESUME_KEY,
+    get_pending_datasets,
+    get_resume_point,
+    is_resume_request,
+    new_checkpoint,
+    prepare_checkpoint,
+    read_checkpoint,
+    record_harvest_run,
+    should_resume_harvest,
+    sync_checkpoint,
+    update_checkpoint,
+    write_checkpoint,
+)
+
+STORE_PATH = "s3://ooi-data/test-stream"
+DATASETS = [
+    {
+        "name": f"file_{i}.nc",
+        "start_ts": f"2020-01-01T00:0{i}:00",
+        "end_ts": f"2020-01-01T00:0{i}:59",
+    }
+    for i in range(3)
+]
+
+
+def _write_store(storage_options, start, periods):
+    ds = xr.Dataset(
+        {"motor_current": ("time", np.arange(periods, dtype="f8"))},
+        coords={
+            "time": pd.date_range(start, periods=periods, freq="s")
+        },
+    )
+    fs, path = fsspec.core.url_to_fs(STORE_PATH, **storage_options)
+    if fs.exists(f"{path}/.zmetadata"):
+        ds.to_zarr(fs.get_mapper(path), append_dim="time", consolidated=True)
+    else:
+        ds.to_zarr(fs.get_mapper(path), consolidated=True)
+
+
+def _checkpoint(request_id="request-1"):
+    checkpoint = new_checkpoint(request_id, DATASETS)
+    # Created before the store below is written
+    checkpoint["created"] = "2000-01-01T00:00:00"
+    return checkpoint
+
+
+def test_sync_checkpoint_partial(storage_options):
+    # Harvest failed part way through the last file
+    _write_store(storage_options, "2020-01-01T00:00:00", 150)
+    checkpoint = sync_checkpoint(_checkpoint(), STORE_PATH, storage_options)
+
+    assert checkpoint["committed"] == ["file_0.nc", "file_1.nc"]
+    assert [d["name"] for d in get_pending_datasets(checkpoint)] == [
+        "file_2.nc"
+    ]
+    assert get_resume_point(checkpoint).isoformat() == "2020-01-01T00:02:29"
+
+
+def test_sync_checkpoint_complete(storage_options):
+    _write_store(storage_options, "2020-01-01T00:00:00", 180)
+    checkpoint = sync_checkpoint(_checkpoint(), STORE_PATH, storage_options)
+
+    assert len(checkpoint["committed"]) == 3
+    assert get_resume_point(checkpoint) is None
+
+
+def test_sync_checkpoint_store_older(storage_options):
+    _write_store(storage_options, "2020-01-01T00:00:00", 150)
+    checkpoint = _checkpoint()
+    checkpoint["created"] = "2100-01-01T00:00:00"
+    checkpoint = sync_checkpoint(checkpoint, STORE_PATH, storage_options)
+
+    assert checkpoint["committed"] == []
+    assert get_resume_point(checkpoint) is None
+
+
+def test_sync_checkpoint_empty_store(storage_options):
+    checkpoint = sync_checkpoint(_checkpoint(), STORE_PATH, storage_options)
+
+    assert checkpoint["committed"] == []
+    assert checkpoint["committed_range"] is None
+    assert get_resume_point(checkpoint) is None
+
+
+def test_resume_request(storage_options):
+    _write_store(storage_options, "2020-01-01T00:00:00", 150)
+    write_checkpoint(_checkpoint(), STORE_PATH, storage_options)
+    response = {"result": {"request_dt": "request-2"}, RESUME_KEY: "request-1"}
+    assert is_resume_request(response)
+    assert not is_resume_request({"result": {"request_dt": "request-2"}})
+
+    # The checkpoint of the resumed request is kept
+    checkpoint = prepare_checkpoint(response, STORE_PATH, storage_options)
+    assert checkpoint["request_id"] == "request-1"
+    assert get_resume_point(checkpoint).isoformat() == "2020-01-01T00:02:29"
+
+    # The resumed harvest appends the rest of the last file
+    _write_store(storage_options, "2020-01-01T00:02:30", 30)
+    checkpoint = update_checkpoint(STORE_PATH, storage_options)
+    assert len(checkpoint["committed"]) == 3
+    assert get_resume_point(checkpoint) is None
+    assert read_checkpoint(STORE_PATH, storage_options) == checkpoint
+
+
+def test_should_resume_harvest(storage_options):
+    assert not should_resume_harvest(STORE_PATH, storage_options)
+
+    record_harvest_run(STORE_PATH, True, storage_options)
+    # Nothing in the store to append to
+    assert not should_resume_harvest(STORE_PATH, storage_options)
+
+    _write_store(storage_options, "2020-01-01T00:00:00", 150)
+    harvest_run = record_harvest_run(STORE_PATH, True, storage_options)
+    assert harvest_run["store_range"]["end"].startswith("2020-01-01T00:02:29")
+    assert should_resume_harvest(STORE_PATH, storage_options)
+
+    record_harvest_run(STORE_PATH, False, storage_options)
+    assert not should_resume_harvest(STORE_PATH, storage_options)
@@ -0,0 +1,66 @@
+import fsspec
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from manifest import (
+    build_manifest,
+    get_current_manifest,
+    read_manifest,
+    update_manifest,
+)
+
+STORE_PATH = "s3://ooi-data/test-stream"
+
+
+def _write_store(storage_options, periods=100, start="2020-01-01"):
+    ds = xr.Dataset(
+        {
+            "motor_current": ("time", np.arange(periods, dtype="f8")),
+            "deployment": ("time", np.ones(periods, dtype="i4")),
+        },
+        coords={
+            "time": pd.date_range(start, periods=periods, freq="s")
+        },
+    ).chunk({"time": 30})
+    fs, path = fsspec.core.url_to_fs(STORE_PATH, **storage_options)
+    if fs.exists(f"{path}/.zmetadata"):
+        ds.to_zarr(fs.get_mapper(path), append_dim="time", consolidated=True)
+    else:
+        ds.to_zarr(fs.get_mapper(path), consolidated=True)
+
+
+def test_read_manifest_missing(storage_options):
+    assert read_manifest(STORE_PATH, storage_options) is None
+    assert get_current_manifest(STORE_PATH, storage_options) is None
+
+
+def test_build_manifest(storage_options):
+    _write_store(storage_options)
+    manifest = build_manifest(STORE_PATH, storage_options)
+
+    assert manifest["time_range"]["start"].startswith("2020-01-01T00:00:00")
+    assert manifest["time_range"]["end"].startswith("2020-01-01T00:01:39")
+    assert set(manifest["variables"]) == {"motor_current", "deployment", "time"}
+    assert manifest["variables"]["motor_current"]["dims"] == ["time"]
+    assert manifest["variables"]["motor_current"]["chunk_count"] == 4
+    assert manifest["chunk_count"] == sum(
+        v["chunk_count"] for v in manifest["variables"].values()
+    )
+
+
+def test_manifest_round_trip(storage_options):
+    _write_store(storage_options)
+    manifest = update_manifest(STORE_PATH, storage_options)
+
+    assert read_manifest(STORE_PATH, storage_options) == manifest
+    assert get_current_manifest(STORE_PATH, storage_options) == manifest
+
+
+def test_manifest_stale_after_append(storage_options):
+    _write_store(storage_options)
+    update_manifest(STORE_PATH, storage_options)
+    _write_store(storage_options, start="2020-01-02")
+
+    assert read_manifest(STORE_PATH, storage_options) is not None
+    assert get_current_manifest(STORE_PATH, storage_options) is None
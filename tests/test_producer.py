@@ -0,0 +1,169 @@
+import json
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+import producer
+from checkpoint import (
+    RESUME_KEY,
+    new_checkpoint,
+    prepare_checkpoint,
+    write_checkpoint,
+)
+from manifest import update_manifest
+
+STORE_PATH = "s3://ooi-data/test-stream"
+REQUEST_DT = "2021-01-01T00:00:00"
+
+
+def _write_store(storage_options, periods):
+    ds = xr.Dataset(
+        {"motor_current": ("time", np.arange(periods, dtype="f8"))},
+        coords={
+            "time": pd.date_range("2020-01-01", periods=periods, freq="s")
+        },
+    )
+    fs, path = fsspec.core.url_to_fs(STORE_PATH, **storage_options)
+    ds.to_zarr(fs.get_mapper(path), consolidated=True)
+
+
+def _write_checkpoint(storage_options):
+    checkpoint = new_checkpoint(
+        "request-1",
+        [
+            {
+                "name": f"file_{i}.nc",
+                "start_ts": f"2020-01-01T00:0{i}:00",
+                "end_ts": f"2020-01-01T00:0{i}:59",
+            }
+            for i in range(3)
+        ],
+    )
+    checkpoint["created"] = "2000-01-01T00:00:00"
+    write_checkpoint(checkpoint, STORE_PATH, storage_options)
+
+
+@pytest.fixture
+def m2m(monkeypatch, tmp_path):
+    """Record the requests produce makes instead of calling OOI M2M."""
+    calls = {}
+
+    def create_request_estimate(**kwargs):
+        calls["estimate"] = kwargs
+        return {"estimated": {"requestUUID": "uuid"}}
+
+    def perform_request(estimated_request, refresh):
+        calls["refresh"] = refresh
+        return {"result": {"request_dt": REQUEST_DT}}
+
+    monkeypatch.setattr(
+        producer,
+        "fetch_streams_list",
+        lambda stream_harvest: [{"table_name": "test-stream"}],
+    )
+    monkeypatch.setattr(
+        producer, "create_request_estimate", create_request_estimate
+    )
+    monkeypatch.setattr(producer, "perform_request", perform_request)
+    monkeypatch.setattr(
+        producer, "RESPONSE_PATH", tmp_path.joinpath("response.json")
+    )
+    monkeypatch.setattr(
+        producer, "REQUEST_STATUS_PATH", tmp_path.joinpath("request.yaml")
+    )
+    return calls
+
+
+def test_no_resume_without_checkpoint(stream_harvest, storage_options):
+    _write_store(storage_options, 150)
+
+    assert producer.get_resume_checkpoint(stream_harvest) is None
+
+
+def test_produce_resumes_incomplete_harvest(
+    stream_harvest, storage_options, m2m
+):
+    stream_harvest.harvest_options.refresh = True
+    # Harvest of request-1 failed part way through the last file
+    _write_store(storage_options, 150)
+    _write_checkpoint(storage_options)
+
+    producer.produce(False, stream_harvest)
+
+    # Only the data after the last committed record is requested,
+    # and appended to the existing data
+    assert m2m["estimate"]["start_dt"] == "2020-01-01T00:02:29.001000"
+    assert m2m["estimate"]["refresh"] is False
+    assert m2m["estimate"]["existing_data_path"] == "s3://ooi-data"
+    assert m2m["refresh"] is False
+
+    response = json.loads(producer.RESPONSE_PATH.read_text())
+    assert response[RESUME_KEY] == "request-1"
+    checkpoint = prepare_checkpoint(response, STORE_PATH, storage_options)
+    assert checkpoint["request_id"] == "request-1"
+
+
+def test_produce_without_resume(stream_harvest, storage_options, m2m):
+    stream_harvest.harvest_options.refresh = True
+
+    producer.produce(False, stream_harvest)
+
+    assert m2m["estimate"]["start_dt"] is None
+    assert m2m["estimate"]["refresh"] is True
+    assert m2m["refresh"] is True
+    response = json.loads(producer.RESPONSE_PATH.read_text())
+    assert RESUME_KEY not in response
+
+
+def test_get_request_range_from_manifest(stream_harvest, storage_options):
+    _write_store(storage_options, 100)
+    update_manifest(STORE_PATH, storage_options)
+
+    request_range = producer.get_request_range(stream_harvest)
+
+    assert request_range["start_dt"] == "2020-01-01T00:01:39.001000"
+    assert request_range["refresh"] is False
+    assert request_range["existing_data_path"] == "s3://ooi-data"
+
+
+def test_get_request_range_without_manifest(stream_harvest, storage_options):
+    _write_store(storage_options, 100)
+
+    request_range = producer.get_request_range(stream_harvest)
+
+    assert request_range["start_dt"] is None
+    assert request_range["refresh"] is False
+    assert request_range["existing_data_path"] == "s3://ooi-data"
+
+
+def test_get_request_range_refresh(stream_harvest, storage_options):
+    stream_harvest.harvest_options.refresh = True
+    _write_store(storage_options, 100)
+    update_manifest(STORE_PATH, storage_options)
+
+    request_range = producer.get_request_range(stream_harvest)
+
+    assert request_range["start_dt"] is None
+    assert request_range["refresh"] is True
+    assert request_range["existing_data_path"] == "s3://ooi-data"
+
+
+def test_produce_from_manifest(stream_harvest, storage_options, m2m):
+    _write_store(storage_options, 100)
+    update_manifest(STORE_PATH, storage_options)
+
+    producer.produce(False, stream_harvest)
+
+    # Same arguments as without a manifest, but the later start
+    assert m2m["estimate"] == {
+        "stream_dct": {"table_name": "test-stream"},
+        "start_dt": "2020-01-01T00:01:39.001000",
+        "end_dt": None,
+        "refresh": False,
+        "existing_data_path": "s3://ooi-data",
+        "request_kwargs": {"provenance": True},
+    }
+    assert m2m["refresh"] is False
@@ -0,0 +1,60 @@
+import json
+from types import SimpleNamespace
+
+import fsspec
+import s3fs
+
+from s3metrics import (
+    METRICS_NAME,
+    S3Metrics,
+    get_pool_env,
+    s3_metrics_state_handler,
+)
+
+STORE_PATH = "s3://ooi-data/test-stream"
+
+
+def _state(running=False, finished=False):
+    return SimpleNamespace(
+        is_running=lambda: running, is_finished=lambda: finished
+    )
+
+
+def test_pool_env(monkeypatch):
+    monkeypatch.setattr(fsspec.config, "conf", {})
+    fsspec.config.set_conf_env(fsspec.config.conf, get_pool_env(5))
+    fs = s3fs.S3FileSystem(anon=True, skip_instance_cache=True)
+    assert fs.config_kwargs == {"max_pool_connections": 5}
+
+
+def test_metrics_count_puts(storage_options):
+    fs = s3fs.S3FileSystem(**storage_options)
+    metrics = S3Metrics()
+    metrics.install()
+    try:
+        for i in range(3):
+            fs.pipe(f"{STORE_PATH}/chunk.{i}", b"x" * 10)
+        fs.cat(f"{STORE_PATH}/chunk.0")
+    finally:
+        metrics.uninstall()
+    fs.pipe(f"{STORE_PATH}/after", b"x")
+
+    summary = metrics.summary()
+    assert summary["puts"] == 3
+    assert summary["bytes_put"] == 30
+    assert summary["calls"]["get_object"] == 1
+    assert summary["retries"] == 0
+    assert summary["throttled"] == 0
+
+
+def test_state_handler_writes_metrics(storage_options):
+    handler = s3_metrics_state_handler(STORE_PATH, storage_options)
+    handler(None, None, _state(running=True))
+    fs = s3fs.S3FileSystem(**storage_options)
+    fs.pipe(f"{STORE_PATH}/chunk.0", b"x" * 10)
+    state = _state(finished=True)
+    assert handler(None, None, state) is state
+
+    summary = json.loads(fs.cat(f"{STORE_PATH}/{METRICS_NAME}"))
+    assert summary["puts"] == 1
+    assert summary["bytes_put"] == 10
@@ -0,0 +1,149 @@
+import json
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+import verify
+from verify import (
+    compare_stats,
+    compute_stats,
+    merge_stats,
+    write_source_cache,
+)
+
+STORE_PATH = "s3://ooi-data/test-stream"
+
+
+def _dataset(start="2020-01-01", periods=60):
+    return xr.Dataset(
+        {
+            "motor_current": ("obs", np.arange(periods, dtype="f8")),
+            "empty": ("obs", np.full(periods, np.nan)),
+        },
+        coords={
+            "time": (
+                "obs",
+                pd.date_range(start, periods=periods, freq="s").values,
+            )
+        },
+    )
+
+
+def test_compute_stats():
+    ds = _dataset()
+    ds["motor_current"][0] = np.nan
+    stats = compute_stats(ds, chunk_size=25)
+
+    assert stats["count"] == 60
+    assert stats["duplicates"] == 0
+    assert stats["non_monotonic"] == 0
+    motor_current = stats["variables"]["motor_current"]
+    assert motor_current["nan_count"] == 1
+    assert motor_current["sum"] == sum(range(1, 60))
+    assert motor_current["min"] == 1.0
+    assert motor_current["max"] == 59.0
+    # Reductions over no valid values are empty, not infinite
+    empty = stats["variables"]["empty"]
+    assert empty["nan_count"] == 60
+    assert empty["min"] is None
+    assert empty["max"] is None
+
+
+def test_compute_stats_time_ranges():
+    ds = _dataset()
+    times = ds["time"].values.view("int64")
+    stats = compute_stats(
+        ds, time_ranges=[(times[0], times[9]), (times[50], times[59])]
+    )
+
+    assert stats["count"] == 20
+    assert stats["outside_range"] == 40
+    assert stats["variables"]["motor_current"]["max"] == 59.0
+
+
+def test_merge_stats():
+    ds = _dataset()
+    merged = merge_stats(
+        [
+            compute_stats(ds.isel(obs=slice(30, None))),
+            compute_stats(ds.isel(obs=slice(0, 30))),
+        ]
+    )
+
+    assert merged == compute_stats(ds)
+
+
+def test_compare_stats():
+    source = compute_stats(_dataset())
+    checks = compare_stats(source, compute_stats(_dataset()))
+
+    assert verify._all_passed(checks)
+    assert checks["variables"]["empty"]["min"]["passed"]
+    # Valid JSON for the process status
+    json.dumps(checks, allow_nan=False)
+
+
+def test_compare_stats_mismatch():
+    source = compute_stats(_dataset())
+    ds = _dataset()
+    ds["motor_current"][10] = 100.0
+    ds["time"][11] = ds["time"][10]
+    checks = compare_stats(source, compute_stats(ds))
+
+    assert not verify._all_passed(checks)
+    assert not checks["variables"]["motor_current"]["passed"]
+    assert not checks["time_duplicates"]["passed"]
+    assert checks["variables"]["empty"]["passed"]
+
+
+@pytest.fixture
+def sources(storage_options):
+    """Store of three source files, the first two read and cached."""
+    ds = _dataset(periods=180)
+    fs, path = fsspec.core.url_to_fs(STORE_PATH, **storage_options)
+    ds.chunk({"obs": 50}).to_zarr(fs.get_mapper(path), consolidated=True)
+    endpoint_url = storage_options["client_kwargs"]["endpoint_url"]
+    urls = [f"{endpoint_url}/{i}.nc" for i in range(3)]
+    write_source_cache(
+        {
+            url: compute_stats(ds.isel(obs=slice(i * 60, (i + 1) * 60)))
+            for i, url in enumerate(urls[:2])
+        },
+        STORE_PATH,
+        storage_options,
+    )
+    return urls
+
+
+def test_verify_skips_expired_sources(sources, storage_options, monkeypatch):
+    # The last source file was purged before it was read
+    monkeypatch.setattr(verify, "get_source_urls", lambda response: sources)
+    verification = verify.verify({}, STORE_PATH, storage_options, workers=1)
+
+    assert verification["status"] == "passed"
+    assert verification["verified_files"] == 2
+    assert verification["expired_files"] == 1
+    assert verification["missing_files"] == []
+    assert verification["store_records_outside_sources"] == 60
+    json.dumps(verification, allow_nan=False)
+
+
+def test_verify_purged_request(sources, storage_options, monkeypatch):
+    def get_source_urls(response):
+        raise FileNotFoundError("catalog.xml")
+
+    monkeypatch.setattr(verify, "get_source_urls", get_source_urls)
+    verification = verify.verify({}, STORE_PATH, storage_options, workers=1)
+
+    assert verification["status"] == "passed"
+    assert verification["verified_files"] == 2
+
+
+def test_verify_nothing_to_verify(storage_options, monkeypatch):
+    monkeypatch.setattr(verify, "get_source_urls", lambda response: [])
+    verification = verify.verify({}, STORE_PATH, storage_options, workers=1)
+
+    assert verification["status"] == "skipped"